@@ -6,11 +6,10 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from collections import namedtuple
 from functools import partial
 
 from .. import errors
-from .. import util
+from .. import ops
 
 from . common import CLOSED
 from . import file
@@ -28,17 +27,29 @@ class Unsupported(Exception):
     """ Requested backend is not supported """
 
 
-class Context(namedtuple("Context", "backend,buffer")):
+class Context:
     """
     Backend context stored per ticket connection.
+
+    The context may be closed more than once, for example when a canceled
+    ticket closes idle contexts, and the connection removes the context later.
+    The buffer is returned to the buffer pool only on the first close.
     """
-    __slots__ = ()
+    __slots__ = ("backend", "buffer", "_closed")
+
+    def __init__(self, backend, buffer):
+        self.backend = backend
+        self.buffer = buffer
+        self._closed = False
 
     def close(self):
+        if self._closed:
+            return
+        self._closed = True
         try:
             self.backend.close()
         finally:
-            self.buffer.close()
+            ops.buffer_pool.release(self.buffer)
 
 
 class Closer:
@@ -107,7 +118,7 @@ def get(req, ticket, config):
             cafile=ca_file)
 
         backend_config = getattr(config, "backend_" + backend.name)
-        buf = util.aligned_buffer(backend_config.buffer_size)
+        buf = ops.buffer_pool.acquire(backend_config.buffer_size)
         ctx = Context(backend, buf)
 
         # Keep the context in the ticket so we monitor the number of
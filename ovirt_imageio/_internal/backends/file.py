@@ -7,6 +7,7 @@
 # (at your option) any later version.
 
 import errno
+import fcntl
 import logging
 import os
 import stat
@@ -38,7 +39,7 @@ def open(url, mode="r", sparse=False, dirty=False, max_connections=8,
             max_writers.
         **options: ignored, file backend does not have any options.
     """
-    fio = util.open(url.path, mode, direct=True)
+    fio = _open(url.path, mode)
     try:
         fio.name = url.path
         mode = os.fstat(fio.fileno()).st_mode
@@ -49,6 +50,21 @@ def open(url, mode="r", sparse=False, dirty=False, max_connections=8,
         raise
 
 
+def _open(path, mode):
+    """
+    Open path for direct I/O, falling back to buffered I/O if the file system
+    does not support direct I/O.
+    """
+    try:
+        return util.open(path, mode, direct=True)
+    except OSError as e:
+        if e.errno != errno.EINVAL:
+            raise
+        log.warning("Direct I/O not supported for %r, using buffered I/O",
+                    path)
+        return util.open(path, mode, direct=False)
+
+
 class Backend:
     """
     Base class for file backends.
@@ -68,6 +84,11 @@ class Backend:
         self._sparse = sparse
         self._dirty = False
         self._max_connections = max_connections
+        # Allocated on the first unaligned write, and reused for the next
+        # unaligned writes.
+        self._block = None
+        flags = fcntl.fcntl(fio.fileno(), fcntl.F_GETFL)
+        self._direct = bool(flags & os.O_DIRECT)
 
     @property
     def max_readers(self):
@@ -98,6 +119,9 @@ class Backend:
     def seek(self, pos, how=os.SEEK_SET):
         return self._fio.seek(pos, how)
 
+    def fileno(self):
+        return self._fio.fileno()
+
     def __enter__(self):
         return self
 
@@ -118,6 +142,9 @@ class Backend:
                 self._fio.close()
             finally:
                 self._fio = CLOSED
+                if self._block is not None:
+                    self._block.close()
+                    self._block = None
 
     # Backend interface.
 
@@ -145,11 +172,24 @@ class Backend:
     def flush(self):
         os.fsync(self._fio.fileno())
         self._dirty = False
+        if not self._direct:
+            # The data is on storage now, so we can drop the cached pages,
+            # avoiding filling the page cache with image data that we are not
+            # going to read again.
+            os.posix_fadvise(
+                self._fio.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
 
     @property
     def block_size(self):
         return self._block_size
 
+    @property
+    def direct(self):
+        """
+        Return True if the backend uses direct I/O.
+        """
+        return self._direct
+
     def extents(self, context="zero"):
         if context != "zero":
             raise errors.UnsupportedOperation(
@@ -216,30 +256,36 @@ class Backend:
         log.debug("Unaligned write start=%s offset=%s count=%s",
                   start, offset, count)
 
-        block = util.aligned_buffer(self._block_size)
-        with closing(block):
-            # 1. Read available bytes in current block.
-            self.seek(start - offset)
-            self.readinto(block)
+        if self._block is None:
+            self._block = util.aligned_buffer(self._block_size)
+        block = self._block
+
+        # 1. Read available bytes in current block. When reading after the
+        # end of the file, clear the rest of the block, since it may contain
+        # data from the previous write.
+        self.seek(start - offset)
+        n = self.readinto(block)
+        if n < self._block_size:
+            block[n:] = b"\0" * (self._block_size - n)
 
-            # 2. Write new bytes into buffer.
-            block[offset:offset + count] = buf[:count]
+        # 2. Write new bytes into buffer.
+        block[offset:offset + count] = buf[:count]
 
-            # 3. Write block back to storage. This aligns the file to block
-            # size by padding zeros if needed.
-            # TODO: When writing to file system, block size may be wrong, so we
-            # need to take care of short writes.
-            self.seek(start - offset)
-            self._fio.write(block)
+        # 3. Write block back to storage. This aligns the file to block
+        # size by padding zeros if needed.
+        # TODO: When writing to file system, block size may be wrong, so we
+        # need to take care of short writes.
+        self.seek(start - offset)
+        self._fio.write(block)
 
-            # 4. Update position.
-            self.seek(start + count)
+        # 4. Update position.
+        self.seek(start + count)
 
         return count
 
     def _clone(self):
         mode = self._fio.mode.replace("b", "")
-        fio = util.open(self._fio.name, mode=mode, direct=True)
+        fio = util.open(self._fio.name, mode=mode, direct=self._direct)
         try:
             return self.__class__(
                 fio,
@@ -256,7 +302,7 @@ class BlockBackend(Backend):
     Block device backend.
     """
 
-    def __init__(self, fio, sparse=False, max_connections=8, block_size=512):
+    def __init__(self, fio, sparse=False, max_connections=8, block_size=None):
         """
         Initialize a BlockBackend.
 
@@ -273,8 +319,7 @@ class BlockBackend(Backend):
         # May be set to False if the first call to fallocate() reveal that it
         # is not supported.
         self._can_fallocate = True
-        # TODO: get block size using ioctl(BLKSSZGET).
-        self._block_size = block_size
+        self._block_size = block_size or self._detect_block_size()
 
     def clone(self):
         """
@@ -288,6 +333,14 @@ class BlockBackend(Backend):
     def max_writers(self):
         return self._max_connections
 
+    def _detect_block_size(self):
+        """
+        Return the device logical block size, required for direct I/O.
+        """
+        block_size = ioutil.blksszget(self._fio.fileno())
+        log.debug("Detected block size %s", block_size)
+        return block_size
+
     def _zero(self, count):
         """
         Zero count bytes at current file position, allocating space.
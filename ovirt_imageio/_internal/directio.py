@@ -30,6 +30,8 @@ class Receive(ops.Write):
     vdsm).
     """
 
+    __slots__ = ()
+
     def __init__(self, path, src, size=None, offset=0, flush=True,
                  buffersize=1024**2, clock=stats.NullClock()):
         url = urllib_parse.urlparse("file:" + path)
@@ -48,4 +50,3 @@ class Receive(ops.Write):
                 self._buf.close()
             finally:
                 self._buf = None
-            super().close()
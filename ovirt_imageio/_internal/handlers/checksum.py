@@ -105,6 +105,8 @@ class Operation(ops.Operation):
     Checksum operation.
     """
 
+    __slots__ = ("_backend", "_algorithm", "_detect_zeroes")
+
     name = "checksum"
 
     def __init__(self, backend, buf, algorithm, detect_zeroes=True,
@@ -7,6 +7,11 @@
 # (at your option) any later version.
 
 import logging
+import os
+import queue
+import threading
+
+from collections import deque
 
 from . import errors
 from . import stats
@@ -14,6 +19,9 @@ from . import util
 
 log = logging.getLogger("ops")
 
+# Maximum number of idle buffers of same size kept in the buffer pool.
+MAX_BUFFERS = 8
+
 
 class EOF(Exception):
     """ Raised when no more data is available and size was not specifed """
@@ -23,8 +31,81 @@ class Canceled(Exception):
     """ Raised when operation was canceled """
 
 
+class BufferPool:
+    """
+    Pool of aligned buffers.
+
+    Allocating a new aligned buffer maps new memory, and touching the buffer
+    for the first time faults every page. Reusing buffers avoids this cost
+    for every request or connection.
+
+    Thread safety: buffers may be acquired and released from multiple
+    threads.
+    """
+
+    def __init__(self, max_buffers=MAX_BUFFERS):
+        self._max_buffers = max_buffers
+        self._lock = threading.Lock()
+        self._buffers = {}
+
+    def acquire(self, size):
+        """
+        Return an aligned buffer of size bytes, reusing an idle buffer if
+        possible. The buffer must be returned to the pool using release().
+        """
+        with self._lock:
+            idle = self._buffers.get(size)
+            if idle:
+                return idle.popleft()
+        if size >= util.HUGE_PAGE_SIZE:
+            return util.aligned_huge_buffer(size)
+        return util.aligned_buffer(size)
+
+    def release(self, buf):
+        """
+        Return buffer to the pool, or close it if the pool has enough idle
+        buffers of this size.
+
+        Raises ValueError if the buffer was already returned to the pool;
+        adding it again would give the same buffer to two users.
+        """
+        with self._lock:
+            idle = self._buffers.setdefault(len(buf), deque())
+            if any(b is buf for b in idle):
+                raise ValueError("Buffer already released: {}".format(buf))
+            if len(idle) < self._max_buffers:
+                idle.append(buf)
+                return
+        buf.close()
+
+    def clear(self):
+        """
+        Close all idle buffers.
+        """
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        for idle in buffers.values():
+            for buf in idle:
+                buf.close()
+
+
+buffer_pool = BufferPool()
+
+
 class Operation:
 
+    # Operations are created for every request, and their attributes are
+    # accessed in the copy loops. Sub classes should define __slots__ for their
+    # attributes.
+    __slots__ = (
+        "_size",
+        "_offset",
+        "_buf",
+        "_done",
+        "_clock",
+        "_canceled",
+    )
+
     # Should be overriden in sub classes.
     name = "operation"
 
@@ -48,14 +129,10 @@ class Operation:
     def done(self):
         return self._done
 
-    @property
-    def _todo(self):
-        return self._size - self._done
-
     def run(self):
         with self._clock.run(self.name) as s:
             res = self._run()
-            s.bytes += self.done
+            s.bytes += self._done
         return res
 
     def _run(self):
@@ -73,9 +150,9 @@ class Operation:
 
     def __repr__(self):
         return ("<{self.__class__.__name__} "
-                "size={self.size} "
+                "size={self._size} "
                 "offset={self._offset} "
-                "done={self.done} "
+                "done={self._done} "
                 "at 0x{id}>").format(self=self, id=id(self))
 
 
@@ -84,6 +161,8 @@ class Read(Operation):
     Read data source backend to file object.
     """
 
+    __slots__ = ("_src", "_dst", "_cache_fd")
+
     name = "read"
 
     def __init__(self, src, dst, buf, size, offset=0, clock=None):
@@ -91,45 +170,188 @@ class Read(Operation):
         self._src = src
         self._dst = dst
 
+        # If the source is a file not using direct I/O, data read from the
+        # source is cached in the page cache. We advise the kernel that we read
+        # the range sequentially, and drop the data we read from the cache.
+        self._cache_fd = None
+        if not getattr(src, "direct", True):
+            self._cache_fd = src.fileno()
+
     def _run(self):
-        skip = self._offset % self._src.block_size
-        self._src.seek(self._offset - skip)
-        if skip:
-            self._read_chunk(skip)
-        while self._todo:
-            self._read_chunk()
-
-    def _read_chunk(self, skip=0):
-        if self._src.tell() % self._src.block_size:
-            raise errors.PartialContent(self.size, self.done)
-
-        # If self._todo is not aligned to backend block_size we read complete
-        # block and drop up to block_size - 1 bytes.
-        aligned_todo = util.round_up(self._todo, self._src.block_size)
-
-        with memoryview(self._buf)[:aligned_todo] as view:
-            with self._record("read") as s:
-                count = self._src.readinto(view)
-                s.bytes += count
-            if count == 0:
-                raise errors.PartialContent(self.size, self.done)
+        if self._cache_fd is not None:
+            os.posix_fadvise(
+                self._cache_fd,
+                self._offset,
+                self._size,
+                os.POSIX_FADV_SEQUENTIAL)
+
+        # When the range does not fit in the buffer, split the buffer, and read
+        # the next chunk while writing the previous one.
+        half = util.round_down(len(self._buf) // 2, self._src.block_size)
+        if half and self._size - self._done > len(self._buf):
+            self._run_pipelined(half)
+            return
+
+        block_size = self._src.block_size
+        skip = self._offset % block_size
+
+        # Track the source position instead of calling tell() for every chunk.
+        pos = self._offset - skip
+        self._src.seek(pos)
+        with memoryview(self._buf) as view:
+            if skip:
+                pos += self._read_chunk(view, block_size, pos, skip)
+            while self._size - self._done:
+                pos += self._read_chunk(view, block_size, pos)
+
+    def _read_chunk(self, view, block_size, pos, skip=0):
+        """
+        Read chunk at source position pos and write it to the destination.
+        Return the number of bytes read.
+        """
+        todo = self._size - self._done
 
-        size = min(count - skip, self._todo)
-        with memoryview(self._buf)[skip:skip + size] as view:
-            with self._record("write") as s:
-                self._dst.write(view)
-                s.bytes += size
+        # A short read in the previous chunk left the position unaligned.
+        if pos % block_size:
+            raise errors.PartialContent(self._size, self._done)
+
+        # If skip + todo is not aligned to backend block_size we read complete
+        # block and drop up to block_size - 1 bytes. Including skip, the first
+        # unaligned chunk reads all the data it needs in one call.
+        count = util.round_up(skip + todo, block_size)
+
+        with view[:count] as v:
+            with self._record("read") as s:
+                n = self._src.readinto(v)
+                s.bytes += n
+            if n == 0:
+                raise errors.PartialContent(self._size, self._done)
+            self._drop_cache(pos, n)
+
+            # In the common case we read complete aligned chunk without
+            # skipping any bytes, and can write it without creating another
+            # view.
+            size = min(n - skip, todo)
+            whole = size == len(v)
+            if whole:
+                with self._record("write") as s:
+                    self._dst.write(v)
+                    s.bytes += size
+
+        if not whole:
+            with view[skip:skip + size] as v:
+                with self._record("write") as s:
+                    self._dst.write(v)
+                    s.bytes += size
         self._done += size
 
         if self._canceled:
             raise Canceled
 
+        return n
+
+    def _run_pipelined(self, half):
+        """
+        Read chunks into one half of the buffer in a reader thread, while
+        writing the other half to the destination.
+        """
+        free = queue.Queue()
+        ready = queue.Queue()
+
+        with memoryview(self._buf) as view:
+            chunks = [view[:half], view[half:half * 2]]
+            for chunk in chunks:
+                free.put(chunk)
+
+            reader = util.start_thread(
+                self._reader, args=(free, ready), name="reader")
+            try:
+                write = self._dst.write
+                todo = self._size - self._done
+                while todo:
+                    item = ready.get()
+                    if item is None:
+                        raise errors.PartialContent(self._size, self._done)
+                    if isinstance(item, Exception):
+                        raise item
+
+                    chunk, skip, size = item
+                    with chunk[skip:skip + size] as v:
+                        with self._record("write") as s:
+                            write(v)
+                            s.bytes += size
+                    self._done += size
+                    todo -= size
+                    free.put(chunk)
+
+                    if self._canceled:
+                        raise Canceled
+            finally:
+                # Wake up the reader if it is waiting for a free chunk.
+                free.put(None)
+                reader.join()
+                for chunk in chunks:
+                    chunk.release()
+
+    def _reader(self, free, ready):
+        """
+        Read the range into free chunks, putting (chunk, skip, size) tuples in
+        the ready queue. Put None if the source does not have enough data, or
+        the exception if reading failed.
+        """
+        src = self._src
+        block_size = src.block_size
+        skip = self._offset % block_size
+        todo = self._size
+        pos = self._offset - skip
+        try:
+            src.seek(pos)
+            while todo:
+                chunk = free.get()
+                if chunk is None:
+                    return
+
+                if pos % block_size:
+                    free.put(chunk)
+                    ready.put(None)
+                    return
+
+                count = util.round_up(skip + todo, block_size)
+                with chunk[:count] as v:
+                    with self._record("read") as s:
+                        n = src.readinto(v)
+                        s.bytes += n
+                self._drop_cache(pos, n)
+                pos += n
+
+                if n <= skip:
+                    free.put(chunk)
+                    ready.put(None)
+                    return
+
+                size = min(n - skip, todo)
+                ready.put((chunk, skip, size))
+                todo -= size
+                skip = 0
+        except Exception as e:
+            ready.put(e)
+
+    def _drop_cache(self, offset, length):
+        """
+        Drop data read from the source from the page cache.
+        """
+        if self._cache_fd is not None:
+            os.posix_fadvise(
+                self._cache_fd, offset, length, os.POSIX_FADV_DONTNEED)
+
 
 class Write(Operation):
     """
     Write data from file object to destination backend.
     """
 
+    __slots__ = ("_src", "_dst", "_flush", "_error")
+
     name = "write"
 
     def __init__(self, dst, src, buf, size=None, offset=0, flush=True,
@@ -138,29 +360,45 @@ class Write(Operation):
         self._src = src
         self._dst = dst
         self._flush = flush
-
-    @property
-    def _todo(self):
-        if self._size is None:
-            return len(self._buf)
-        return self._size - self._done
+        # Set by the writer thread if writing failed.
+        self._error = None
 
     def _run(self):
+        size = self._size
+        block_size = self._dst.block_size
         try:
             self._dst.seek(self._offset)
 
             # If offset is not aligned to block size, receive partial chunk
             # until the start of the next block.
-            unaligned = self._offset % self._dst.block_size
+            unaligned = self._offset % block_size
             if unaligned:
-                count = min(self._todo, self._dst.block_size - unaligned)
+                count = block_size - unaligned
+                if size is not None:
+                    count = min(size, count)
                 self._write_chunk(count)
 
             # Now current file position is aligned to block size and we can
-            # receive full chunks.
-            while self._todo:
-                count = min(self._todo, len(self._buf))
-                self._write_chunk(count)
+            # receive full chunks. Use only complete blocks, so writing a full
+            # chunk never requires read-modify-write of the last block.
+            step = len(self._buf)
+            if step > block_size:
+                step = util.round_down(step, block_size)
+
+            # When the range does not fit in the buffer, split the buffer, and
+            # read the next chunk while writing the previous one.
+            half = util.round_down(len(self._buf) // 2, block_size)
+            if (half and size is not None and
+                    size - self._done > len(self._buf)):
+                self._run_pipelined(half)
+            else:
+                # If size is not specified, write until the source is
+                # exhausted.
+                count = step if size is None else min(size - self._done, step)
+                while count:
+                    self._write_chunk(count)
+                    if size is not None:
+                        count = min(size - self._done, step)
         except EOF:
             pass
 
@@ -169,41 +407,113 @@ class Write(Operation):
                 self._dst.flush()
 
     def _write_chunk(self, count):
+        readinto = self._src.readinto
+        write = self._dst.write
+
         self._buf.seek(0)
         with memoryview(self._buf)[:count] as view:
-            read = 0
-            while read < count:
-                with view[read:] as v:
-                    with self._record("read") as s:
-                        n = self._src.readinto(v)
-                        s.bytes += n
-                if not n:
-                    break
-                read += n
-
-            pos = 0
-            while pos < read:
-                with view[pos:read] as v:
-                    with self._record("write") as s:
-                        n = self._dst.write(v)
-                        s.bytes += n
-                pos += n
+            # Short reads and writes are common, so we record stats once per
+            # chunk instead of once per call.
+            with self._record("read") as s:
+                read = _readinto(readinto, view)
+                s.bytes += read
+
+            with self._record("write") as s:
+                _write(write, view, read)
+                s.bytes += read
 
         self._done += read
         if read < count:
             if self._size is None:
                 raise EOF
-            raise errors.PartialContent(self.size, self.done)
+            raise errors.PartialContent(self._size, self._done)
 
         if self._canceled:
             raise Canceled
 
+    def _run_pipelined(self, half):
+        """
+        Read chunks from the source into one half of the buffer, while writing
+        the other half to the destination in a writer thread.
+        """
+        free = queue.Queue()
+        ready = queue.Queue()
+
+        with memoryview(self._buf) as view:
+            chunks = [view[:half], view[half:half * 2]]
+            for chunk in chunks:
+                free.put(chunk)
+
+            writer = util.start_thread(
+                self._writer, args=(free, ready), name="writer")
+            try:
+                readinto = self._src.readinto
+                todo = self._size - self._done
+                while todo:
+                    chunk = free.get()
+                    if chunk is None:
+                        # Writing failed.
+                        break
+
+                    count = min(todo, half)
+                    with chunk[:count] as v:
+                        with self._record("read") as s:
+                            read = _readinto(readinto, v)
+                            s.bytes += read
+
+                    if read:
+                        ready.put((chunk, read))
+                    todo -= read
+                    if read < count:
+                        break
+
+                    if self._canceled:
+                        raise Canceled
+            finally:
+                # Wake up the writer after writing the ready chunks.
+                ready.put(None)
+                writer.join()
+                for chunk in chunks:
+                    chunk.release()
+
+        if self._error is not None:
+            raise self._error
+
+        if self._done < self._size:
+            raise errors.PartialContent(self._size, self._done)
+
+    def _writer(self, free, ready):
+        """
+        Write (chunk, count) tuples from the ready queue to the destination,
+        returning the chunks to the free queue. If writing failed, keep the
+        exception and put None in the free queue.
+        """
+        write = self._dst.write
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    return
+
+                chunk, count = item
+                with self._record("write") as s:
+                    _write(write, chunk, count)
+                    s.bytes += count
+
+                self._done += count
+                free.put(chunk)
+        except Exception as e:
+            self._error = e
+            free.put(None)
+
 
 class Zero(Operation):
     """
     Zero byte range.
     """
 
+    __slots__ = ("_dst", "_flush")
+
     name = "zero"
 
     # Limit zero size so we update self._done frequently enough to provide
@@ -228,12 +538,14 @@ class Zero(Operation):
     def _run(self):
         self._dst.seek(self._offset)
 
-        while self._todo:
-            step = min(self._todo, self.MAX_STEP)
+        todo = self._size - self._done
+        while todo:
+            step = min(todo, self.MAX_STEP)
             with self._record("zero") as s:
                 n = self._dst.zero(step)
                 s.bytes += n
             self._done += n
+            todo -= n
             if self._canceled:
                 raise Canceled
 
@@ -247,6 +559,8 @@ class Flush(Operation):
     Flush received data to storage.
     """
 
+    __slots__ = ("_dst",)
+
     name = "flush"
 
     def __init__(self, dst, clock=None):
@@ -255,3 +569,36 @@ class Flush(Operation):
 
     def _run(self):
         self._dst.flush()
+
+
+def _readinto(readinto, view):
+    """
+    Read into view until view is full or the source is exhausted, and return
+    the number of bytes read. Sub views are created only for short reads.
+    """
+    n = readinto(view)
+    if not n or n == len(view):
+        return n or 0
+
+    read = n
+    while read < len(view):
+        with view[read:] as v:
+            n = readinto(v)
+        if not n:
+            break
+        read += n
+    return read
+
+
+def _write(write, view, count):
+    """
+    Write count bytes from the start of view. Sub views are created only for
+    writing part of view, or for short writes.
+    """
+    if count == len(view):
+        pos = write(view)
+    else:
+        pos = 0
+    while pos < count:
+        with view[pos:count] as v:
+            pos += write(v)
@@ -7,6 +7,7 @@
 # (at your option) any later version.
 
 import collections
+import errno
 import io
 import mmap
 import os
@@ -58,6 +59,50 @@ def aligned_buffer(size):
     return mmap.mmap(-1, size, mmap.MAP_SHARED)
 
 
+HPAGE_PMD_SIZE = "/sys/kernel/mm/transparent_hugepage/hpage_pmd_size"
+
+
+def _huge_page_size():
+    """
+    Return the size of a transparent huge page. The size depends on the
+    architecture and the kernel page size, so we read it from the kernel,
+    assuming 2 MiB (the size on x86_64) if the kernel does not report it.
+    """
+    try:
+        with io.open(HPAGE_PMD_SIZE) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 2 * 1024**2
+
+
+# Buffers smaller than this cannot use huge pages.
+HUGE_PAGE_SIZE = _huge_page_size()
+
+
+def aligned_huge_buffer(size):
+    """
+    Return buffer aligned to page size, advising the kernel to back it with
+    transparent huge pages. Using huge pages for large buffers reduces TLB
+    misses when copying data.
+
+    We don't use MAP_HUGETLB; the hugetlb pool is reserved by the admin for
+    VMs. Transparent huge pages are used only if enabled for shared memory
+    (/sys/kernel/mm/transparent_hugepage/shmem_enabled), and the kernel falls
+    back to normal pages if huge pages are not available.
+    """
+    buf = aligned_buffer(size)
+    # Not available before python 3.8, or if the kernel does not support
+    # transparent huge pages.
+    if hasattr(mmap, "MADV_HUGEPAGE"):
+        try:
+            buf.madvise(mmap.MADV_HUGEPAGE)
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                buf.close()
+                raise
+    return buf
+
+
 def open(path, mode, direct=True, sync=False):
     """
     Open a file for direct I/O.
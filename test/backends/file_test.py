@@ -91,6 +91,33 @@ def test_open_no_create(mode):
     assert e.value.errno == errno.ENOENT
 
 
+def test_open_no_direct_io(tmpurl, monkeypatch):
+    util_open = util.open
+
+    def open_no_direct(path, mode, direct=True, sync=False):
+        if direct:
+            raise OSError(errno.EINVAL, "Invalid argument")
+        return util_open(path, mode, direct=False, sync=sync)
+
+    # Simulate file system that does not support direct I/O.
+    monkeypatch.setattr(util, "open", open_no_direct)
+
+    with file.open(tmpurl, "r+") as f:
+        assert not f.direct
+        f.write(b"x" * 4096)
+        f.flush()
+        with f.clone() as c:
+            assert not c.direct
+
+    with io.open(tmpurl.path, "rb") as f:
+        assert f.read() == b"x" * 4096
+
+
+def test_open_direct_io(tmpurl):
+    with file.open(tmpurl, "r+") as f:
+        assert f.direct
+
+
 def test_close(tmpurl):
     with file.open(tmpurl, "r+") as b:
         pass
@@ -179,6 +206,29 @@ def test_block_size_allocated(user_file, size):
         assert f.read() == b"x" * size
 
 
+@pytest.mark.skipif(os.geteuid() != 0, reason="Requires root")
+@pytest.mark.parametrize("sector_size", [512, 4096])
+def test_block_size_block_device(tmpdir, sector_size):
+    backing_file = str(tmpdir.join("backing_file"))
+    with io.open(backing_file, "wb") as f:
+        f.truncate(1024**2)
+
+    out = subprocess.check_output([
+        "losetup",
+        "--find",
+        "--show",
+        "--sector-size", str(sector_size),
+        backing_file,
+    ])
+    loop = out.strip().decode("ascii")
+    try:
+        url = urllib.parse.urlparse("file:" + loop)
+        with file.open(url) as f:
+            assert f.block_size == sector_size
+    finally:
+        subprocess.check_call(["losetup", "--detach", loop])
+
+
 def test_readinto(user_file):
     with io.open(user_file.path, "wb") as f:
         f.write(b"a" * 4096)
@@ -367,6 +417,25 @@ def test_write_unaligned_buffer_slow_path(user_file):
         assert f.read() == b"x" * (user_file.sector_size - 10)
 
 
+def test_write_unaligned_buffer_slow_path_after_end(user_file):
+    # Perform 2 slow read-modify-writes reusing the same block buffer. The
+    # second write must not leak data from the first write.
+    with file.open(user_file.url, "r+") as f:
+        bs = f.block_size
+        n = f.write(b"a" * 10)
+        assert n == 10
+        f.seek(bs)
+        n = f.write(b"b" * 10)
+        assert n == 10
+        assert f.tell() == bs + 10
+
+    with io.open(user_file.path, "rb") as f:
+        assert f.read(10) == b"a" * 10
+        assert f.read(bs - 10) == b"\0" * (bs - 10)
+        assert f.read(10) == b"b" * 10
+        assert f.read() == b"\0" * (bs - 10)
+
+
 def test_write_unaligned_buffer_fast_path(user_file):
     size = user_file.sector_size * 4
     start = user_file.sector_size
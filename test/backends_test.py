@@ -14,6 +14,7 @@ from ovirt_imageio._internal import backends
 from ovirt_imageio._internal import config
 from ovirt_imageio._internal import errors
 from ovirt_imageio._internal import nbd
+from ovirt_imageio._internal import ops
 
 from . import testutil
 from . marks import flaky_in_ovirt_ci
@@ -36,6 +37,29 @@ def cfg():
     return config.load([])
 
 
+def test_get_cancel_and_remove(tmpurl, cfg, monkeypatch):
+    pool = ops.BufferPool()
+    monkeypatch.setattr(ops, "buffer_pool", pool)
+    ticket = auth.Ticket(
+        testutil.create_ticket(url=urlunparse(tmpurl)), cfg)
+    req = Request()
+    ctx = backends.get(req, ticket, cfg)
+
+    # Canceling the ticket closes the idle context, and closing the
+    # connection closes it again.
+    ticket.cancel()
+    ticket.remove_context(req.connection_id)
+
+    # The buffer was returned to the pool only once.
+    size = cfg.backend_file.buffer_size
+    b1 = pool.acquire(size)
+    b2 = pool.acquire(size)
+    assert b1 is ctx.buffer
+    assert b2 is not b1
+    b1.close()
+    b2.close()
+
+
 def test_get_caching(tmpurl, cfg):
     ticket = auth.Ticket(
         testutil.create_ticket(url=urlunparse(tmpurl)), cfg)
@@ -117,6 +117,21 @@ def test_recv_repr(tmpfile):
     assert "size=100 offset=42 done=0" in rep
 
 
+def test_recv_close(tmpfile):
+    op = directio.Receive(tmpfile, None, 100)
+    op.close()
+    # Closing twice does nothing.
+    op.close()
+
+
+def test_recv_slots(tmpfile):
+    op = directio.Receive(tmpfile, None, 100)
+    try:
+        assert not hasattr(op, "__dict__")
+    finally:
+        op.close()
+
+
 @pytest.mark.parametrize("bufsize", [512, 1024, 2048])
 def test_receive_unbuffered_stream(tmpfile, bufsize):
     chunks = [b"a" * 8192,
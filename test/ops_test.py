@@ -67,6 +67,16 @@ def test_run():
     assert op.done == 100
 
 
+@pytest.mark.parametrize("op", [
+    ops.Read(None, None, bytearray(0), 100),
+    ops.Write(None, None, bytearray(0), 100),
+    ops.Zero(None, 100),
+    ops.Flush(None),
+], ids=lambda op: op.name)
+def test_slots(op):
+    assert not hasattr(op, "__dict__")
+
+
 def test_cancel():
     op = Operation(size=100)
     assert op.offset == 0
@@ -110,6 +120,47 @@ def test_stats(fake_time):
     )
 
 
+def test_buffer_pool_reuse():
+    pool = ops.BufferPool()
+    buf = pool.acquire(8192)
+    assert len(buf) == 8192
+    pool.release(buf)
+    assert pool.acquire(8192) is buf
+
+    # Buffer of another size is not reused.
+    pool.release(buf)
+    other = pool.acquire(4096)
+    assert len(other) == 4096
+    assert other is not buf
+    other.close()
+    pool.clear()
+    assert buf.closed
+
+
+def test_buffer_pool_max_buffers():
+    pool = ops.BufferPool(max_buffers=1)
+    a = pool.acquire(4096)
+    b = pool.acquire(4096)
+    pool.release(a)
+    pool.release(b)
+    assert not a.closed
+    assert b.closed
+    pool.clear()
+    assert a.closed
+
+
+def test_buffer_pool_release_twice():
+    pool = ops.BufferPool()
+    buf = pool.acquire(4096)
+    pool.release(buf)
+    with pytest.raises(ValueError):
+        pool.release(buf)
+    assert pool.acquire(4096) is buf
+    assert pool.acquire(4096) is not buf
+    pool.clear()
+    buf.close()
+
+
 @pytest.mark.parametrize("trailer", [
     pytest.param(0, id="no-trailer"),
     pytest.param(8192, id="trailer"),
@@ -148,6 +199,52 @@ def test_read_partial_content(user_file, offset, size):
     assert e.value.available == size - 1
 
 
+def test_read_fadvise(tmpdir, monkeypatch):
+    calls = []
+
+    def posix_fadvise(fd, offset, length, advice):
+        calls.append((offset, length, advice))
+
+    monkeypatch.setattr(os, "posix_fadvise", posix_fadvise)
+
+    data = b"x" * 16384
+    src_path = str(tmpdir.join("src"))
+    with io.open(src_path, "wb") as f:
+        f.write(data)
+
+    # Without direct I/O, the data read is dropped from the page cache.
+    fio = util.open(src_path, "r", direct=False)
+    fio.name = src_path
+    dst = io.BytesIO()
+    with file.FileBackend(fio) as src, util.aligned_buffer(8192) as buf:
+        op = ops.Read(src, dst, buf, 12288, offset=100)
+        op.run()
+
+    assert calls[0] == (100, 12288, os.POSIX_FADV_SEQUENTIAL)
+    dropped = [c for c in calls if c[2] == os.POSIX_FADV_DONTNEED]
+    assert dropped[0][0] <= 100
+    assert dropped[-1][0] + dropped[-1][1] >= 100 + 12288
+
+    assert dst.getvalue() == data[100:100 + 12288]
+
+
+def test_read_unaligned_offset_stats(user_file):
+    with io.open(user_file.path, "wb") as f:
+        f.write(b"x" * 16384)
+
+    dst = io.BytesIO()
+    clock = stats.Clock()
+    with file.open(user_file.url, "r") as src, \
+            util.aligned_buffer(1024**2) as buf:
+        op = ops.Read(src, dst, buf, 8192, offset=100, clock=clock)
+        op.run()
+
+    # The first chunk includes the skipped bytes, so unaligned offset does
+    # not require another read.
+    assert clock._stats["read.read"].ops == 1
+    assert dst.getvalue() == b"x" * 8192
+
+
 def test_read_seek():
     src = memory.Backend("r", bytearray(b"0123456789"))
     src.seek(8)
@@ -158,6 +255,64 @@ def test_read_seek():
     assert dst.getvalue() == b"01234"
 
 
+def test_read_pipelined():
+    data = bytearray(bytes(range(100)))
+    src = memory.Backend("r", data)
+    dst = io.BytesIO()
+    # Range larger than buffer reads into one half of the buffer while writing
+    # the other half.
+    with util.aligned_buffer(32) as buf:
+        op = ops.Read(src, dst, buf, 90, offset=5)
+        op.run()
+    assert op.done == 90
+    assert dst.getvalue() == data[5:95]
+
+
+def test_read_pipelined_partial_content():
+    src = memory.Backend("r", bytearray(b"x" * 100))
+    dst = io.BytesIO()
+    with util.aligned_buffer(32) as buf:
+        op = ops.Read(src, dst, buf, 101)
+        with pytest.raises(errors.PartialContent) as e:
+            op.run()
+    assert e.value.requested == 101
+    assert e.value.available == 100
+    assert dst.getvalue() == b"x" * 100
+
+
+def test_read_pipelined_error():
+
+    class Backend(memory.Backend):
+
+        def readinto(self, buf):
+            if self.tell() >= 32:
+                raise RuntimeError("Read failed")
+            return super().readinto(buf)
+
+    src = Backend("r", bytearray(b"x" * 100))
+    with util.aligned_buffer(32) as buf:
+        op = ops.Read(src, io.BytesIO(), buf, 100)
+        with pytest.raises(RuntimeError):
+            op.run()
+    assert op.done == 32
+
+
+def test_read_pipelined_cancel():
+
+    class Dst(io.BytesIO):
+
+        def write(self, buf):
+            op.cancel()
+            return super().write(buf)
+
+    src = memory.Backend("r", bytearray(b"x" * 100))
+    with util.aligned_buffer(32) as buf:
+        op = ops.Read(src, Dst(), buf, 100)
+        with pytest.raises(ops.Canceled):
+            op.run()
+    assert op.done == 16
+
+
 def test_read_repr():
     op = ops.Read(None, None, None, 200, offset=24)
     rep = repr(op)
@@ -235,6 +390,75 @@ def test_write_partial_content(user_file, offset, size):
     assert e.value.available == size - 1
 
 
+def test_write_pipelined():
+    data = bytes(range(100))
+    dst = memory.Backend("r+", bytearray(b"a" * 100))
+    src = util.UnbufferedStream([data[:7], data[7:40], data[40:90]])
+    # Range larger than buffer writes one half of the buffer while reading
+    # into the other half.
+    with util.aligned_buffer(32) as buf:
+        op = ops.Write(dst, src, buf, 90, offset=5)
+        op.run()
+    assert op.done == 90
+    dst.seek(0)
+    b = bytearray(100)
+    assert dst.readinto(b) == 100
+    assert b == b"a" * 5 + data[:90] + b"a" * 5
+
+
+def test_write_pipelined_partial_content():
+    dst = memory.Backend("r+")
+    src = io.BytesIO(b"x" * 100)
+    with util.aligned_buffer(32) as buf:
+        op = ops.Write(dst, src, buf, 101)
+        with pytest.raises(errors.PartialContent) as e:
+            op.run()
+    assert e.value.requested == 101
+    assert e.value.available == 100
+    dst.seek(0)
+    b = bytearray(101)
+    assert dst.readinto(b) == 100
+    assert b[:100] == b"x" * 100
+
+
+# Fail on the first chunk, in the middle, and on the last chunk, after reading
+# the entire range.
+@pytest.mark.parametrize("fail_at", [0, 32, 96])
+def test_write_pipelined_error(fail_at):
+
+    class Backend(memory.Backend):
+
+        def write(self, buf):
+            if self.tell() >= fail_at:
+                raise RuntimeError("Write failed")
+            return super().write(buf)
+
+    dst = Backend("r+")
+    src = io.BytesIO(b"x" * 100)
+    with util.aligned_buffer(32) as buf:
+        op = ops.Write(dst, src, buf, 100)
+        with pytest.raises(RuntimeError):
+            op.run()
+    assert op.done == fail_at
+
+
+def test_write_pipelined_cancel():
+
+    class Src(io.BytesIO):
+
+        def readinto(self, buf):
+            op.cancel()
+            return super().readinto(buf)
+
+    dst = memory.Backend("r+")
+    with util.aligned_buffer(32) as buf:
+        op = ops.Write(dst, Src(b"x" * 100), buf, 100)
+        with pytest.raises(ops.Canceled):
+            op.run()
+    # The chunk read before canceling is written.
+    assert op.done == 16
+
+
 def test_write_seek():
     dst = memory.Backend("r+", bytearray(b"a" * 10))
     dst.seek(8)
@@ -289,6 +513,28 @@ def test_write_unbuffered_stream(user_file):
         assert f.read() == b""
 
 
+def test_write_stats():
+    chunks = [b"a" * 8192,
+              b"b" * 42,
+              b"c" * (8192 - 42)]
+    src = util.UnbufferedStream(chunks)
+    size = sum(len(c) for c in chunks)
+    dst = memory.Backend("r+")
+    clock = stats.Clock()
+
+    with util.aligned_buffer(1024**2) as buf:
+        op = ops.Write(dst, src, buf, size, clock=clock)
+        op.run()
+
+    # Short reads are recorded once per chunk.
+    read = clock._stats["write.read"]
+    assert read.ops == 1
+    assert read.bytes == size
+    write = clock._stats["write.write"]
+    assert write.ops == 1
+    assert write.bytes == size
+
+
 def test_write_unbuffered_stream_partial_content(user_file):
     chunks = [b"a" * 8192,
               b"b" * 42,
@@ -6,6 +6,8 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import errno
+import mmap
 import time
 
 import pytest
@@ -78,6 +80,58 @@ def test_round_down(size, rounded):
     assert util.round_down(size, 512) == rounded
 
 
+@pytest.mark.parametrize("size", [
+    util.HUGE_PAGE_SIZE // 2,
+    util.HUGE_PAGE_SIZE,
+    util.HUGE_PAGE_SIZE + mmap.PAGESIZE,
+])
+def test_aligned_huge_buffer(size):
+    with util.aligned_huge_buffer(size) as buf:
+        assert len(buf) == size
+        buf[-1:] = b"x"
+        assert buf[-1:] == b"x"
+
+
+def test_aligned_huge_buffer_no_madv_hugepage(monkeypatch):
+    monkeypatch.delattr(mmap, "MADV_HUGEPAGE", raising=False)
+    with util.aligned_huge_buffer(util.HUGE_PAGE_SIZE) as buf:
+        assert len(buf) == util.HUGE_PAGE_SIZE
+
+
+def test_aligned_huge_buffer_madvise(monkeypatch):
+    # Transparent huge pages for shared memory are disabled by default, so we
+    # can only check that we advise the kernel.
+    calls = []
+
+    class Mmap(mmap.mmap):
+        def madvise(self, option, *args):
+            calls.append(option)
+
+    monkeypatch.setattr(mmap, "MADV_HUGEPAGE", 14, raising=False)
+    monkeypatch.setattr(mmap, "mmap", Mmap)
+    with util.aligned_huge_buffer(util.HUGE_PAGE_SIZE) as buf:
+        assert len(buf) == util.HUGE_PAGE_SIZE
+    assert calls == [mmap.MADV_HUGEPAGE]
+
+
+def test_aligned_huge_buffer_madvise_unsupported(monkeypatch):
+
+    class Mmap(mmap.mmap):
+        def madvise(self, option, *args):
+            raise OSError(errno.EINVAL, "Invalid argument")
+
+    monkeypatch.setattr(mmap, "MADV_HUGEPAGE", 14, raising=False)
+    monkeypatch.setattr(mmap, "mmap", Mmap)
+    with util.aligned_huge_buffer(util.HUGE_PAGE_SIZE) as buf:
+        assert len(buf) == util.HUGE_PAGE_SIZE
+
+
+def test_huge_page_size():
+    size = util.HUGE_PAGE_SIZE
+    assert size > 0
+    assert size % mmap.PAGESIZE == 0
+
+
 @pytest.mark.parametrize("value,expected", [
     ("value", "value"),
     ("value", "value"),